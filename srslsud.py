@@ -7,8 +7,18 @@ Supports various sources - Snap, Flatpak, Ubuntu Make and APT.
 import sys
 import os
 import subprocess
+import json
+import csv
+import re
 from urllib.parse import urlsplit
+from collections import namedtuple
 import datetime
+import io
+import threading
+import functools
+import operator
+import itertools
+from concurrent.futures import ThreadPoolExecutor
 
 try:
     import gi
@@ -26,6 +36,8 @@ import aptsources.distro
 from aptsources import sourceslist
 import apt_pkg
 
+apt_pkg.init()
+
 print("This script will save or load software lists installed from various sources: Snap, Flatpak, Ubuntu Make and APT.")
 
 apt_ok = False
@@ -51,7 +63,12 @@ else:
     print("Warning: please install 'flatpak' deb-package for Flatpak support!")
 
 umake_ok = False
-if os.access("/usr/bin/umake", os.X_OK) or os.access("/snap/bin/umake", os.X_OK):
+umake_path = None
+for umake_candidate in ("/usr/bin/umake", "/snap/bin/umake"):
+    if os.access(umake_candidate, os.X_OK):
+        umake_path = umake_candidate
+        break
+if umake_path:
     umake_ok = True
     print("Note: your system supports Ubuntu Make.")
 else:
@@ -82,11 +99,14 @@ if flatpak_ok:
         print("Error: please install 'gir1.2-flatpak-1.0' deb-package for Flatpak support.")
         sys.exit()
 
+# prefer C-implemented JSON modules, fallback to stdlib 'json'
 try:
-    import jsonpickle
-except Exception:
-    print("Error: please install 'python3-jsonpickle' deb-package for JSON file support.")
-    sys.exit()
+    import orjson as json_backend
+except ImportError:
+    try:
+        import ujson as json_backend
+    except ImportError:
+        json_backend = json
 
 snap_json_filename = 'snaps.json'
 flatpak_json_filename = 'flatpaks.json'
@@ -94,22 +114,40 @@ umake_json_filename = 'umake.json'
 deb_pkg_filename = 'debs.json'
 apt_script_file = 'apt.sh'
 
+# package lists which are stored in debs.json as key header and rows
+apt_packed_sections = {
+    'official_packages': ['name', 'component', 'archive'],
+    'launchpad_ppa_packages': ['name', 'repo'],
+    'thirdparty_packages': ['name', 'repo'],
+}
+
+# installation order of system Snaps by their type, other types are applications
+snap_system_ranks = {'snapd': 0, 'os': 1, 'core': 1, 'base': 2}
+
+install_workers = 4  # number of parallel Snap and Flatpak installations
+
+umake_installed_re = re.compile(r'\[(partially |fully |)installed\]')
+
 """
 local functions start
 """
 
 debug_on = False
 
+apt_debcache = None  # (sources, cache, depcache) tuple, see apt_get_debcache()
+
 
 def save_object(file_name, obj):
     """
     Function for saving object 'obj' to JSON file specified by 'file_name'
     """
 
-    jsonpickle.set_preferred_backend('json')
-    jsonpickle.set_encoder_options('json', ensure_ascii=False)
-    with open(file_name, 'w', encoding='utf-8') as f:
-        s = jsonpickle.encode(obj)
+    if json_backend.__name__ == 'orjson':  # always produces UTF-8 bytes
+        s = json_backend.dumps(obj)
+    else:
+        s = json_backend.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+    with open(file_name, 'wb') as f:
         f.write(s)
 
 
@@ -119,9 +157,8 @@ def load_object(file_name):
     """
 
     try:
-        with open(file_name, encoding='utf-8') as f:
-            s = f.read()
-            obj = jsonpickle.decode(s)
+        with open(file_name, 'rb') as f:
+            obj = json_backend.loads(f.read())
         return obj
     except Exception:
         print("\tError: unable to open '{}'. Can't continue.".format(file_name))
@@ -135,35 +172,68 @@ def flatpak_repo_add(name, url):
     and more complicated methods of URL construction.
     """
 
-    flatpak_command = "flatpak remote-add --if-not-exists " + name + " "
-
     full_repo_url = url.replace("oci+", "") + name + ".flatpakrepo"
+    full_repo_url_split = urlsplit(full_repo_url)
+    full_repo_url_path = full_repo_url_split.path.split('/')
+    full_repo_url_host = full_repo_url_split.scheme + '://' + (full_repo_url_split.hostname or '') + '/'
+
+    candidate_urls = [
+        # try remote as URL + .flatpakref
+        full_repo_url,
+        # move .flatpakref to the toplevel
+        full_repo_url_host + full_repo_url_path[-1],
+        # move .flatpakref to the first level
+        full_repo_url_host + full_repo_url_path[1] + '/' + full_repo_url_path[-1],
+        # move .flatpakref to the first level, rename folder to flatpak-refs
+        full_repo_url_host + 'flatpak-refs/' + full_repo_url_path[-1],
+    ]
+
+    for candidate_url in candidate_urls:
+        if subprocess.call(["flatpak", "remote-add", "--if-not-exists", name, candidate_url], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) == 0:
+            return 0
 
-    # try remote as URL + .flatpakref
-    if subprocess.call(flatpak_command + full_repo_url, shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) == 0:
-        return 0
+    # giving up
+    return 1
 
-    # move .flatpakref to the toplevel
-    full_repo_url_split = urlsplit(full_repo_url)
-    full_repo_url_toplevel = full_repo_url_split.scheme + '://' + full_repo_url_split.hostname + '/' + full_repo_url_split.path.split('/')[-1]
 
-    if subprocess.call(flatpak_command + full_repo_url_toplevel, shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) == 0:
-        return 0
+def snap_install_rank(snap):
+    """
+    Auxilary function to get installation order of Snap described by 'snap' record.
+    Snapd, core and base snaps get ranks 0-2 and should be installed in this order before applications,
+    applications get None. Records without known 'type' (old JSON files, old bindings) are checked by name.
+    """
+
+    snap_type = snap.get('type')
+    if snap_type in (None, 'unknown'):
+        if snap['name'] == 'snapd':
+            snap_type = 'snapd'
+        elif snap['name'].startswith('core') or snap['name'] == 'bare':
+            snap_type = 'base'
 
-    # move .flatpakref to the first level
-    full_repo_url_firstlevel = full_repo_url_split.scheme + '://' + full_repo_url_split.hostname + '/' + full_repo_url_split.path.split('/')[1] + '/' + full_repo_url_split.path.split('/')[-1]
+    return snap_system_ranks.get(snap_type)
 
-    if subprocess.call(flatpak_command + full_repo_url_firstlevel, shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) == 0:
-        return 0
 
-    # move .flatpakref to the first level, rename folder to flatpak-refs
-    full_repo_url_firstlevel_fr = full_repo_url_split.scheme + '://' + full_repo_url_split.hostname + '/flatpak-refs/' + full_repo_url_split.path.split('/')[-1]
+def snap_install(snap):
+    """
+    Auxilary function for installing Snap described by 'snap' record.
+    Returns error message or None on success.
+    """
 
-    if subprocess.call(flatpak_command + full_repo_url_firstlevel_fr, shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) == 0:
-        return 0
+    if snap['classic']:
+        install_flag = Snapd.InstallFlags.CLASSIC
+    else:
+        install_flag = Snapd.InstallFlags.NONE
 
-    # giving up
-    return 1
+    # separate client for each call, so it may be used from worker threads
+    snapd_client = Snapd.Client()
+    snapd_client.connect_sync()
+
+    try:
+        snapd_client.install2_sync(install_flag, snap['name'], snap['channel'], None, None, None, None)
+    except Exception as e:
+        return e.message
+
+    return None
 
 
 def snap_operations(operation='save'):
@@ -191,16 +261,21 @@ def snap_operations(operation='save'):
                 s['classic'] = (snap.get_confinement() == Snapd.Confinement.CLASSIC)
                 s['channel'] = snap.get_channel()
                 s['revision'] = snap.get_revision()
+                if hasattr(snap, 'get_snap_type'):
+                    s['type'] = snap.get_snap_type().value_nick
 
                 print("\tTitle: " + str(snap.get_title()))
                 print("\tClassic?: " + str(s['classic']))
                 print("\tName: " + s['name'])
                 print("\tChannel: " + s['channel'])
                 print("\tRevision: " + s['revision'])
+                if 'type' in s:
+                    print("\tType: " + s['type'])
                 print("\t---")
 
                 snap_list.append(s)
-                save_object(snap_json_filename, snap_list)
+
+            save_object(snap_json_filename, snap_list)
         else:
             print("Note: you do not have any Snaps installed.")
 
@@ -213,27 +288,62 @@ def snap_operations(operation='save'):
             for snap in snap_list:
                 print("Trying to install '{}' from '{}' channel at '{}' revision".format(snap['name'], snap['channel'], snap['revision']))
 
-                if snap['classic']:
-                    install_flag = Snapd.InstallFlags.CLASSIC
-                else:
-                    install_flag = Snapd.InstallFlags.NONE
+            # snapd, core and base snaps are prerequisites of applications,
+            # install them one by one first to avoid conflicting snapd changes
+            system_snaps = sorted((snap for snap in snap_list if snap_install_rank(snap) is not None), key=snap_install_rank)
+            app_snaps = [snap for snap in snap_list if snap_install_rank(snap) is None]
 
-                try:
-                    snapd_client.install2_sync(install_flag, snap['name'], snap['channel'], None, None, None, None)
-                except Exception as e:
-                    print("\t{}".format(e.message))
+            snap_errors = [snap_install(snap) for snap in system_snaps]
+
+            # the first application is installed alone too, so polkit asks for authorization only once
+            snap_errors += [snap_install(snap) for snap in app_snaps[:1]]
+
+            # installations of other applications are network-bound, so run several of them at once
+            with ThreadPoolExecutor(max_workers=install_workers) as executor:
+                snap_errors += executor.map(snap_install, app_snaps[1:])
+
+            for snap, error in zip(system_snaps + app_snaps, snap_errors):
+                if error:
+                    print("\t{}: {}".format(snap['name'], error))
         else:
             print("Error: can't find any Snaps in the '{}' file.".format(snap_json_filename))
 
     print("Snap finished.")
 
 
+def flatpak_install(flatpak, fpl):
+    """
+    Auxilary function for installing Flatpak described by 'fpl' record
+    into 'flatpak' installation.
+    Returns error message or None on success.
+    """
+
+    if fpl['kind'] == 'runtime':
+        kind = Flatpak.RefKind.RUNTIME
+    elif fpl['kind'] == 'application':
+        kind = Flatpak.RefKind.APP
+
+    try:
+        flatpak.install(fpl['origin'],
+                        kind,
+                        fpl['name'],
+                        fpl['arch'],
+                        fpl['branch'],
+                        None,
+                        None,
+                        None)
+    except Exception as e:
+        return e.message
+
+    return None
+
+
 def flatpak_operations(operation='save'):
     """
     Function for Flatpak operations
     """
 
-    flatpak_list = []
+    flatpak_list = {'repos': [], 'refs': []}
 
     flatpak = Flatpak.Installation.new_system()
 
@@ -250,8 +360,7 @@ def flatpak_operations(operation='save'):
                 print("\tRepo name: " + repos['repo-name'])
                 print("\tRepo URL: " + repos['repo-url'])
                 print("\t---")
-                flatpak_list.append(repos)
-                save_object(flatpak_json_filename, flatpak_list)
+                flatpak_list['repos'].append(repos)
         else:
             print("Note: you do not have any Flatpakrefs configured")
 
@@ -278,45 +387,53 @@ def flatpak_operations(operation='save'):
                 print("\tOrigin: " + f['origin'])
                 print("\t---")
 
-                flatpak_list.append(f)
-                save_object(flatpak_json_filename, flatpak_list)
+                flatpak_list['refs'].append(f)
         else:
             print("Note: you do not have any Flatpaks installed.")
 
+        if flatpak_list['repos'] or flatpak_list['refs']:
+            save_object(flatpak_json_filename, flatpak_list)
+
     else:  # 'load'
         flatpak_list = load_object(flatpak_json_filename)
-        if len(flatpak_list) > 0:
-            print("Will now load list of Flatpaks and their remotes to install")
+        if isinstance(flatpak_list, list):  # old format - repos and refs in one list
+            flatpak_list = {'repos': [fpl for fpl in flatpak_list if 'repo-name' in fpl],
+                            'refs': [fpl for fpl in flatpak_list if 'repo-name' not in fpl]}
 
-            for fpl in flatpak_list:
-                if len(fpl) == 2:
-                    print("Flatpak repo record found: '{}' '{}', will try to add it.".format(fpl['repo-name'], fpl['repo-url']))
+        if len(flatpak_list['repos']) > 0 or len(flatpak_list['refs']) > 0:
+            print("Will now load list of Flatpaks and their remotes to install")
 
-                    if flatpak_repo_add(fpl['repo-name'], fpl['repo-url']) != 0:
-                        print("Error: add '{}' repo failed!".format(fpl['repo-name']))
-                    else:
-                        flatpak.drop_caches(None)
-                        flatpak.update_remote_sync(fpl['repo-name'], None)
+            # all remotes should be added before installation of refs
+            added_repos = []
+            for fpl in flatpak_list['repos']:
+                print("Flatpak repo record found: '{}' '{}', will try to add it.".format(fpl['repo-name'], fpl['repo-url']))
 
+                if flatpak_repo_add(fpl['repo-name'], fpl['repo-url']) != 0:
+                    print("Error: add '{}' repo failed!".format(fpl['repo-name']))
                 else:
-                    print("Trying to install '{}' from '{}' using '{}' branch with '{}'".format(fpl['name'], fpl['origin'], fpl['branch'], fpl['arch']))
-
-                    if fpl['kind'] == 'runtime':
-                        kind = Flatpak.RefKind.RUNTIME
-                    elif fpl['kind'] == 'application':
-                        kind = Flatpak.RefKind.APP
-
-                    try:
-                        flatpak.install(fpl['origin'],
-                                        kind,
-                                        fpl['name'],
-                                        fpl['arch'],
-                                        fpl['branch'],
-                                        None,
-                                        None,
-                                        None)
-                    except Exception as e:
-                        print("\t{}".format(e.message))
+                    added_repos.append(fpl['repo-name'])
+
+            if added_repos:
+                flatpak.drop_caches(None)
+                for repo_name in added_repos:
+                    flatpak.update_remote_sync(repo_name, None)
+
+            for fpl in flatpak_list['refs']:
+                print("Trying to install '{}' from '{}' using '{}' branch with '{}'".format(fpl['name'], fpl['origin'], fpl['branch'], fpl['arch']))
+
+            # runtimes should be installed before applications which use them,
+            # refs of the same kind are installed in parallel after the first one,
+            # which is installed alone so polkit asks for authorization only once
+            for kind_name in ('runtime', 'application'):
+                refs = [fpl for fpl in flatpak_list['refs'] if fpl['kind'] == kind_name]
+
+                ref_errors = [flatpak_install(flatpak, fpl) for fpl in refs[:1]]
+                with ThreadPoolExecutor(max_workers=install_workers) as executor:
+                    ref_errors += executor.map(lambda fpl: flatpak_install(flatpak, fpl), refs[1:])
+
+                for fpl, error in zip(refs, ref_errors):
+                    if error:
+                        print("\t{}: {}".format(fpl['name'], error))
         else:
             print("Error: can't find any Flatpaks and their remotes in the '{}' file.".format(flatpak_json_filename))
 
@@ -332,14 +449,17 @@ def umake_operations(operation='save'):
 
     print("Will process Ubuntu Make applications using '{}' mode.".format(operation))
     if operation == 'save':
-        umake_cmd = "umake --list-available | grep -E '\[(partially\ |fully\ |)installed\]' | awk -F: '{print $1}'"
-        umake_ret, umake_out = subprocess.getstatusoutput(umake_cmd)
-
-        if umake_ret == 0 and umake_out.find("error") == -1:
-            if len(umake_out) > 0:
+        umake_proc = subprocess.run([umake_path, "--list-available"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        umake_ret = umake_proc.returncode
+        umake_err = umake_proc.stderr
+
+        # keep only installed categories and applications, strip their descriptions
+        umake_out_lines = [l.split(':', 1)[0] for l in umake_proc.stdout.splitlines() if umake_installed_re.search(l)]
+        # check only stderr, so application names with 'error' are not treated as failures
+        if umake_ret == 0 and "error" not in umake_err.lower():
+            if len(umake_out_lines) > 0:
                 # parsing umake output - two columns
                 # (first with category, second - with program name)
-                umake_out_lines = umake_out.split('\n')
                 umake_items_raw = []
 
                 for l in umake_out_lines:
@@ -361,11 +481,13 @@ def umake_operations(operation='save'):
                             print("\t---")
 
                             umake_list.append(ui)
-                            save_object(umake_json_filename, umake_list)
+
+                    if umake_list:
+                        save_object(umake_json_filename, umake_list)
             else:
                 print("Note: you do not have any applications installed using 'umake'.")
         else:
-            print("Error: 'umake' process failed with following message:\n{}.".format(umake_out))
+            print("Error: 'umake' process failed with following message:\n{}.".format(umake_err))
 
     else:  # 'load'
         umake_list = load_object(umake_json_filename)
@@ -375,7 +497,7 @@ def umake_operations(operation='save'):
             for um in umake_list:
                 print("Trying to install '{}' from '{}' category using Ubuntu Make".format(um['application'], um['category']))
 
-                if subprocess.call("umake {} {}".format(um['category'], um['application']), shell=True) != 0:
+                if subprocess.call([umake_path, um['category'], um['application']]) != 0:
                     print("Error: installation of '{}' from '{}' category failed!".format(um['application'], um['category']))
 
         else:
@@ -386,6 +508,9 @@ def umake_operations(operation='save'):
 
 # APT functions
 
+# installed package record, origin attributes are resolved once on categorization
+AptPackageRecord = namedtuple('AptPackageRecord', ['name', 'origin', 'component', 'archive'])
+
 
 def apt_show_package_names_list(p_list):
     """
@@ -393,7 +518,7 @@ def apt_show_package_names_list(p_list):
     """
     o = []
     for p in p_list:
-        o.append(p[0])
+        o.append(p.name)
 
     return(o)
 
@@ -417,15 +542,19 @@ def apt_key_list():
 
     cmd = ["/usr/bin/apt-key", "--quiet", "adv", "--with-colons", "--batch", "--fixed-list-mode", "--list-keys"]
     res = []
-    p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True).stdout
-    name = ''
-    for line in p:
-        fields = line.split(":")
-        if fields[0] in ["pub", "uid"]:
-            name = fields[9]
-        if fields[0] == "pub":
+    p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+    key = None
+    expiry = None
+    for fields in csv.reader(p.stdout.splitlines(), delimiter=':', quoting=csv.QUOTE_NONE):
+        if not fields:
+            continue
+        record = fields[0]
+        if record == "pub":
             key = fields[4]
             expiry = datetime.date.fromtimestamp(int(fields[5])).isoformat()
+        elif record != "uid" or key is None:  # skip uid without pub
+            continue
+        name = fields[9]
         if not name:
             continue
         k = dict()
@@ -433,8 +562,6 @@ def apt_key_list():
         k['expiry'] = expiry
         k['name'] = name
         res.append(k)
-        name = ''
-    p.close()
     return res
 
 
@@ -452,46 +579,67 @@ def apt_sources_list():
     return(sources_list)
 
 
-def apt_parse_debcache(package_list):
+def apt_get_debcache():
+    """
+    Function to open APT sources list, package cache and dependency cache.
+    They are opened only once and then reused by the next calls.
+    """
+
+    global apt_debcache
+
+    if apt_debcache is None:
+        sources = apt_pkg.SourceList()
+        sources.read_main_list()
+
+        cache = apt_pkg.Cache()
+        depcache = apt_pkg.DepCache(cache)
+
+        apt_debcache = (sources, cache, depcache)
+
+    return apt_debcache
+
+
+def apt_parse_debcache(*package_lists):
     """
     This is adapted code from /usr/share/doc/python-apt-doc/examples/indexfile.py example.
     It parses dependency cache and returns full information about package name and its origin.
+    Accepts several package lists and returns the list of results for each of them.
     """
 
-    apt_pkg.init()
-
-    sources = apt_pkg.SourceList()
-    sources.read_main_list()
+    sources, cache, depcache = apt_get_debcache()
 
-    cache = apt_pkg.Cache()
-    depcache = apt_pkg.DepCache(cache)
+    # index files are shared by many packages, find each of them only once
+    index_cache = dict()
 
-    out_list = []
+    out_lists = []
 
-    for p in package_list:
-        pkg = cache[p[0]]
-        cand = depcache.get_candidate_ver(pkg)
-        for (f, __) in cand.file_list:
-            index = sources.find_index(f)
-            # print("index: {}".format(index))
-            if index:
-                if index.label == "Debian Package Index":
-                    out_el = dict()
-                    out_el['name'] = pkg.name
-                    # print(pkg.name)
-                    out_el['origin'] = p[1]
-                    # print(p[1])
-                    # print("archive_uri: {}".format(index.archive_uri("")))
-                    out_el['describe'] = index.describe
-                    # print("describe: {}".format(index.describe))
-                    # print("exists: {}".format(index.exists))
-                    # print("has_packages: {}".format(index.has_packages))
-                    # print("size: {}".format(index.size))
-                    # print("is_trusted: {}".format(index.is_trusted))
-                    # print("- - -\n")
-                    out_list.append(out_el)
+    for package_list in package_lists:
+        out_list = []
 
-    return out_list
+        for p in package_list:
+            pkg = cache[p.name]
+            cand = depcache.get_candidate_ver(pkg)
+            for (f, __) in cand.file_list:
+                try:
+                    index = index_cache[f.id]
+                except KeyError:
+                    index = index_cache[f.id] = sources.find_index(f)
+                # print("index: {}".format(index))
+                if index:
+                    if index.label == "Debian Package Index":
+                        out_el = dict()
+                        out_el['name'] = pkg.name
+                        out_el['origin'] = p.origin
+                        out_el['component'] = p.component
+                        out_el['archive'] = p.archive
+                        out_el['describe'] = index.describe
+                        # print("describe: {}".format(index.describe))
+                        # print("- - -\n")
+                        out_list.append(out_el)
+
+        out_lists.append(out_list)
+
+    return out_lists
 
 
 def apt_remove_word_from_brackets_in_sources_list(st, wordtoremove):
@@ -508,11 +656,7 @@ def apt_remove_word_from_brackets_in_sources_list(st, wordtoremove):
     debug_on and print("1 - split: {}".format(ss))
 
     if len(ss) == 2:
-        sss = ss[0].split()
-        for sb in sss:
-            if wordtoremove in sb:
-                sss.remove(sb)
-
+        sss = [sb for sb in ss[0].split() if wordtoremove not in sb]
         st = ' '.join(sss) + "]" + ss[1]
 
         if "[" not in st:
@@ -527,30 +671,79 @@ def apt_remove_word_from_brackets_in_sources_list(st, wordtoremove):
     return(st)
 
 
+def apt_get_uri_from_sources_list_line(st):
+    """
+    Function to get repository URI from deb-url line like
+    "deb [arch=amd64] https://download.docker.com/linux/ubuntu bionic stable",
+    options in brackets are skipped.
+    """
+
+    in_options = False
+    for w in st.split()[1:]:
+        if w.startswith("["):
+            in_options = True
+        if in_options:
+            if w.endswith("]"):
+                in_options = False
+            continue
+
+        return w.rstrip("/")
+
+    return ""
+
+
 def apt_add_deb_url_to_deb_info(deb_info, sources_list):
     """
     Function to add special 'deb-url' field to the package info structure.
     Also it calls the auxiliary function to remove "signed-by" from 'deb-url'.
     """
 
+    # index sources list lines by URI once, later lines win as before
+    sources_index = dict()
+    for s in sources_list:
+        uri = apt_get_uri_from_sources_list_line(s)
+        if uri:
+            sources_index[uri] = s
+
+    deb_urls = dict()
+
     for t in deb_info:
         ds = t['describe'].split(" ")[0]
+        uri = ds.rstrip("/")
 
-        for s in sources_list:
-            if ds in s:
-                t['deb-url'] = apt_remove_word_from_brackets_in_sources_list(s, "signed-by")
+        if uri not in sources_index:
+            # fallback to substring search, remember the result
+            sources_index[uri] = None
+            for s in sources_list:
+                if ds in s:
+                    sources_index[uri] = s
 
-        debug_on and print("{}: {}".format(t['name'], t['deb-url']))
+        s = sources_index[uri]
+        if s is not None:
+            if s not in deb_urls:
+                deb_urls[s] = apt_remove_word_from_brackets_in_sources_list(s, "signed-by")
+            t['deb-url'] = deb_urls[s]
+
+        debug_on and print("{}: {}".format(t['name'], t.get('deb-url')))
 
     return deb_info
 
 
+@functools.lru_cache(maxsize=None)
 def apt_get_ppa_shortcut(url):
     """
     Function to transform full deb-url for PPA to 'ppa:username/ppa-name' shortcut.
+    Results are cached because many packages share the same PPA.
+    Newer 'add-apt-repository' writes 'ppa.launchpadcontent.net' host instead of 'ppa.launchpad.net'.
     """
 
-    ppa_split = url.split("ppa.launchpad.net/")[1].split("/", 2)
+    for ppa_host in ("ppa.launchpad.net/", "ppa.launchpadcontent.net/"):
+        if ppa_host in url:
+            ppa_split = url.split(ppa_host)[1].split("/", 2)
+            break
+    else:
+        raise ValueError("unknown Launchpad PPA host in deb-url '{}'".format(url))
+
     ppa_shortcut = ""
     if len(ppa_split) >= 2:
         ppa_shortcut = "ppa:" + ppa_split[0] + "/" + ppa_split[1]
@@ -558,25 +751,69 @@ def apt_get_ppa_shortcut(url):
     return ppa_shortcut
 
 
+def apt_load_jsonpickle_object(file_name):
+    """
+    Function for loading 'debs.json' file saved by older versions of this script using jsonpickle.
+    Such files contain pickled distro object and {"py/id": N} references to repeated keys,
+    so they can't be loaded as plain JSON.
+    """
+
+    try:
+        import jsonpickle
+    except ImportError:
+        print("Error: '{}' was saved by older version of this script. Please re-save it with this version or install 'python3-jsonpickle' deb-package. Can't continue.".format(file_name))
+        sys.exit()
+
+    try:
+        with open(file_name, 'rb') as f:
+            deb_pkg_list = jsonpickle.decode(f.read())
+        distro = deb_pkg_list['distro']
+        deb_pkg_list['distro'] = {'id': distro.id, 'codename': distro.codename, 'release': distro.release}
+    except Exception:
+        print("Error: unable to load '{}' saved by older version of this script. Please re-save it with this version. Can't continue.".format(file_name))
+        sys.exit()
+
+    return deb_pkg_list
+
+
+def pack_records(records, keys):
+    """
+    Function to convert list of dictionaries with the same keys to the compact form
+    with key header and rows of values - {'keys': [...], 'rows': [[...], ...]}
+    """
+
+    return {'keys': keys, 'rows': [[r[k] for k in keys] for r in records]}
+
+
+def unpack_records(packed):
+    """
+    Function to convert compact form from 'pack_records' back to list of dictionaries,
+    lists from old JSON files are returned as is
+    """
+
+    if isinstance(packed, list):
+        return packed
+
+    keys = packed['keys']
+    return [dict(zip(keys, row)) for row in packed['rows']]
+
+
 def extract_unique_elements(elements_list, repo_key_name):
     """
     Function to collect unique elements with known key in the new list
     """
-    out_list = []
-
-    for el in elements_list:
-        if el[repo_key_name] not in out_list:
-            out_list.append(el[repo_key_name])
 
-    return out_list
+    return list(dict.fromkeys(map(operator.itemgetter(repo_key_name), elements_list)))
 
 
-def append_command_to_script(filename, command):
+@functools.lru_cache(maxsize=1)
+def apt_get_distro():
     """
-    Function for appending lines to the file with known filename
+    Function to detect running distro only once,
+    because 'get_distro' may call 'lsb_release' for this.
     """
-    with open(filename, mode='a+') as fsh:
-        fsh.write(command + "\n")
+
+    return aptsources.distro.get_distro()
 
 
 def apt_operations(operation='save'):
@@ -587,43 +824,57 @@ def apt_operations(operation='save'):
     """
 
     # 1. Detecting operating system
-    distro = aptsources.distro.get_distro()
+    distro = apt_get_distro()
+    distro_id = distro.id
+    distro_codename = distro.codename
+    distro_release = distro.release
     if isinstance(distro, aptsources.distro.UbuntuDistribution):
         distro_name = 'Ubuntu'
-        print("You are running {} {} ({}) distro.".format(distro_name, distro.release, distro.codename))
+        print(f"You are running {distro_name} {distro_release} ({distro_codename}) distro.")
     elif isinstance(distro, aptsources.distro.DebianDistribution):
         distro_name = 'Debian'
         debian_nearest_ubuntu_version = 'jammy'
-        if distro.codename == 'stretch':
+        if distro_codename == 'stretch':
             debian_nearest_ubuntu_version = 'xenial'
-        elif distro.codename == 'buster':
+        elif distro_codename == 'buster':
             debian_nearest_ubuntu_version = 'bionic'
-        elif distro.codename == 'bullseye':
+        elif distro_codename == 'bullseye':
             debian_nearest_ubuntu_version = 'focal'
-        elif distro.codename == 'bookworm':
+        elif distro_codename == 'bookworm':
             debian_nearest_ubuntu_version = 'jammy'
-        print("You are running {} {} ({}) distro.".format(distro_name, distro.release, distro.codename))
-    elif distro.id == 'AstraLinuxCE' or distro.id == 'AstraLinux':
+        print(f"You are running {distro_name} {distro_release} ({distro_codename}) distro.")
+    elif distro_id == 'AstraLinuxCE' or distro_id == 'AstraLinux':
         distro_name = 'AstraLinux'
         astra_nearest_ubuntu_version = 'bionic'
-        if distro.codename == 'orel':
+        if distro_codename == 'orel':
             astra_nearest_ubuntu_version = 'xenial'
-        print("You are running {} {} ({}) distro.".format(distro_name, distro.release, distro.codename))
+        print(f"You are running {distro_name} {distro_release} ({distro_codename}) distro.")
     else:
-        print("Error: your distro '{}' is not supported!".format(distro.id))
+        print(f"Error: your distro '{distro_id}' is not supported!")
 
-    print("Will process deb-packaged applications using '{}' mode.".format(operation))
+    print(f"Will process deb-packaged applications using '{operation}' mode.")
     if operation == 'save':
         # 2. Installed packages part - listing them and arranging
-        # next four lines are taken from: https://unix.stackexchange.com/a/369653/65781
+        # next lines are adapted from: https://unix.stackexchange.com/a/369653/65781
         apt_cache = apt.Cache()
 
-        manual = set(pkg for pkg in apt_cache if pkg.is_installed and not pkg.is_auto_installed)
-        depends = set(dep_pkg.name for pkg in manual for dep in pkg.installed.get_dependencies('PreDepends', 'Depends', 'Recommends') for dep_pkg in dep)
+        manual = [pkg for pkg in apt_cache if pkg.is_installed and not pkg.is_auto_installed]
 
-        installed = sorted([pkg.name for pkg in manual if pkg.name not in depends])
+        deps_kinds = ('PreDepends', 'Depends', 'Recommends')
+        depends = set()
+        depends_add = depends.add
+        for pkg in manual:
+            inst = pkg.installed
+            if inst is None:
+                continue
+            for dep in inst.get_dependencies(*deps_kinds):
+                for dep_pkg in dep:
+                    depends_add(dep_pkg.name)
 
-        print("Total number of manually installed packages: {}.".format(len(installed)))
+        manual_pkgs = {pkg.name: pkg for pkg in manual}
+        installed = sorted(manual_pkgs.keys() - depends)
+
+        print(f"Total number of manually installed packages: {len(installed)}.")
 
         # sorting installed packages
         pkg_ubuntu = list()
@@ -632,35 +883,34 @@ def apt_operations(operation='save'):
         pkg_local = list()
 
         for i in installed:
-            pkg = apt_cache[i]
+            pkg = manual_pkgs[i]
             o = pkg.installed.origins[0]
-            if o.origin == distro_name:
-                pkg_ubuntu.append([pkg.name, o])
-            if o.origin != distro_name and o.archive != 'now' and o.trusted and o.origin.startswith("LP-PPA"):
-                # print(pkg)
-                # print("\t{}".format(o))
-                # print("- - -\n")
-                pkg_thirdparty_ppa.append([pkg.name, o])
-            if o.origin != distro_name and o.archive != 'now' and o.trusted and not o.origin.startswith("LP-PPA"):
-                # print(pkg)
-                # print("\t{}".format(o))
-                # print("- - -\n")
-                pkg_thirdparty_deb.append([pkg.name, o])
-            if o.archive == 'now' or not o.trusted:
+            origin = o.origin
+            archive = o.archive
+            if archive == 'now' or not o.trusted:
                 pkg_local.append(pkg.name)
+                continue
+
+            record = AptPackageRecord(pkg.name, o, o.component, archive)
+            if origin == distro_name:
+                pkg_ubuntu.append(record)
+            elif origin.startswith("LP-PPA"):
+                pkg_thirdparty_ppa.append(record)
+            else:
+                pkg_thirdparty_deb.append(record)
 
         # listing installed packages
 
-        print("\n\nPackages installed from official Ubuntu repositories ({}):".format(len(pkg_ubuntu)))
+        print(f"\n\nPackages installed from official Ubuntu repositories ({len(pkg_ubuntu)}):")
         print(apt_show_package_names_list(pkg_ubuntu))
 
-        print("\n\nPackages installed from thirdparty PPA repositories ({}):".format(len(pkg_thirdparty_ppa)))
+        print(f"\n\nPackages installed from thirdparty PPA repositories ({len(pkg_thirdparty_ppa)}):")
         print(apt_show_package_names_list(pkg_thirdparty_ppa))
 
-        print("\n\nPackages installed from thirdparty deb-repositories ({}):".format(len(pkg_thirdparty_deb)))
+        print(f"\n\nPackages installed from thirdparty deb-repositories ({len(pkg_thirdparty_deb)}):")
         print(apt_show_package_names_list(pkg_thirdparty_deb))
 
-        print("\n\nPackages installed from local deb-files ({}):".format(len(pkg_local)))
+        print(f"\n\nPackages installed from local deb-files ({len(pkg_local)}):")
         print(pkg_local)
 
         print("\n\nList of trusted keys from apt-key:")
@@ -677,16 +927,15 @@ def apt_operations(operation='save'):
 
         print("\n\nWill now calculate the dependencies for all installed packages.")
 
+        pkg_ubuntu_info, pkg_thirdparty_ppa_info, pkg_thirdparty_deb_info = apt_parse_debcache(pkg_ubuntu, pkg_thirdparty_ppa, pkg_thirdparty_deb)
+
         debug_on and print("\n\nWill now show the origins of official packages:")
-        pkg_ubuntu_info = apt_parse_debcache(pkg_ubuntu)
         debug_on and print(pkg_ubuntu_info)
 
         debug_on and print("\n\nWill now show the origins of thirdparty PPA packages:")
-        pkg_thirdparty_ppa_info = apt_parse_debcache(pkg_thirdparty_ppa)
         debug_on and print(pkg_thirdparty_ppa_info)
 
         debug_on and print("\n\nWill now show the origins of thirdparty deb packages:")
-        pkg_thirdparty_deb_info = apt_parse_debcache(pkg_thirdparty_deb)
         debug_on and print(pkg_thirdparty_deb_info)
 
         debug_on and print("\n\ndeb-url for PPAs:")
@@ -702,7 +951,7 @@ def apt_operations(operation='save'):
 
         # 6. Preparing data for JSON
         deb_pkg_list = dict()
-        deb_pkg_list['distro'] = distro
+        deb_pkg_list['distro'] = {'id': distro_id, 'codename': distro_codename, 'release': distro_release}
         deb_pkg_list['package_stats'] = {'total': len(installed), 'official': len(pkg_ubuntu), 'ppas': len(pkg_thirdparty_ppa), 'thirdparty': len(pkg_thirdparty_deb), 'local': len(pkg_local)}
         deb_pkg_list['official_packages'] = []
         deb_pkg_list['launchpad_ppa_packages'] = []
@@ -713,8 +962,8 @@ def apt_operations(operation='save'):
         for op in pkg_ubuntu_info:
             op_info = dict()
             op_info['name'] = op['name']
-            op_info['component'] = op['origin'].component
-            op_info['archive'] = op['origin'].archive
+            op_info['component'] = op['component']
+            op_info['archive'] = op['archive']
             deb_pkg_list['official_packages'].append(op_info)
 
         for lpp in pkg_thirdparty_ppa_info:
@@ -724,143 +973,265 @@ def apt_operations(operation='save'):
             deb_pkg_list['launchpad_ppa_packages'].append(lpp_info)
 
         # 5. Key management for thirdparty deb-repositories
+
+        # normalize key names once instead of doing it for every package
+        keys_norm = []
+        for k in apt_keys:
+            kname = k['name']
+            is_lp = kname.startswith("Launchpad")
+            obs_repo_user = None  # OpenSuSe Build Service
+            if not is_lp and "build.opensuse.org" in kname:
+                if "home\\x" in kname:
+                    obs_repo_user = bytes(kname, encoding='utf-8').decode("unicode_escape").replace("home:", "home:/").split(" ")[0]
+                else:
+                    obs_repo_user = kname.split(" ")[0]
+                # debug_on and print(obs_repo_user)
+            keys_norm.append((k, kname, kname.lower(), is_lp, obs_repo_user))
+
         for p in pkg_thirdparty_deb_info:
-            # debug_on and print("app: {}".format(p))
+            # debug_on and print(f"app: {p}")
+            pname = p['name']
+            pname_sp = pname.replace("-", " ")
+            origin = p['origin'].origin
+            label = p['origin'].label
+            deb_url = p.get('deb-url', "")
 
             tp_info = dict()
-            tp_info['name'] = p['name']
+            tp_info['name'] = pname
             try:  # avoid missed 'deb-url' key case
                 tp_info['repo'] = p['deb-url']
             except KeyError:
                 tp_info['repo'] = []
             deb_pkg_list['thirdparty_packages'].append(tp_info)
 
-            for k in apt_keys:
-                if k['name'].startswith("Launchpad"):
-                    # print("\tkey: {}".format(k['name']))
+            for k, kname, kname_lower, is_lp, obs_repo_user in keys_norm:
+                if is_lp:
                     # TODO: add keys only for active PPAs
-
                     ppak = dict()
-                    ppak['name'] = k['name']
+                    ppak['name'] = kname
                     ppak['key'] = k
                     deb_pkg_list['thirdparty_keys'].append(ppak)
-                else:
-                    # print("\tkey: {}".format(k['name']))
-
-                    e1 = k['name'] in p['name']
-                    e2 = p['name'] in k['name']
-                    e3 = len(p['origin'].origin) > 0 and p['origin'].origin in k['name']
-                    e4 = len(p['origin'].label) > 0 and p['origin'].label in k['name']
-                    e5 = len(p['origin'].label) > 0 and k['name'] in p['origin'].label
-                    e6 = False  # OpenSuSe Build Service
-                    e7 = p['name'].replace("-", " ") in k['name'].lower()  # Yandex Disk
-
-                    if "build.opensuse.org" in k['name']:
-                        # debug_on and print("{} is OBS".format(k))
-                        if "home\\x" in k['name']:
-                            obs_repo_user = bytes(k['name'], encoding='utf-8').decode("unicode_escape").replace("home:", "home:/").split(" ")[0]
-                            # debug_on and print(obs_repo_user)
-                            e6 = obs_repo_user in p['deb-url']
-                        else:
-                            obs_repo_user = k['name'].split(" ")[0]
-                            # debug_on and print(obs_repo_user)
-                            e6 = obs_repo_user in p['deb-url']
-
-                    if e1 or e2 or e3 or e4 or e5 or e6 or e7:
-                        debug_on and print("\t\tkey for '{}' seems to be found as {}".format(p['name'], k))
-                        tpk = dict()
-                        tpk['name'] = p['name']
-                        tpk['key'] = k
-                        deb_pkg_list['thirdparty_keys'].append(tpk)
+                elif (kname in pname
+                      or pname in kname
+                      or (origin and origin in kname)
+                      or (label and (label in kname or kname in label))
+                      or (obs_repo_user is not None and obs_repo_user in deb_url)
+                      or pname_sp in kname_lower):  # Yandex Disk
+                    debug_on and print(f"\t\tkey for '{pname}' seems to be found as {k}")
+                    tpk = dict()
+                    tpk['name'] = pname
+                    tpk['key'] = k
+                    deb_pkg_list['thirdparty_keys'].append(tpk)
 
         # 6. Saving package information to JSON
-        print("\n\nSaving packages list to the '{}' file.".format(deb_pkg_filename))
+        print(f"\n\nSaving packages list to the '{deb_pkg_filename}' file.")
         debug_on and print(deb_pkg_list)
+        for section, keys in apt_packed_sections.items():
+            deb_pkg_list[section] = pack_records(deb_pkg_list[section], keys)
         save_object(deb_pkg_filename, deb_pkg_list)
 
     else:  # 'load'
         print("Will now load list of deb-packages to install.")
 
-        with open(apt_script_file, 'w') as fsh:
-            fsh.close()
+        # installation script lines, written to the file at once
+        script_lines = []
 
         deb_pkg_list = load_object(deb_pkg_filename)
+        if 'py/object' in deb_pkg_list['distro']:  # saved by older version using jsonpickle
+            deb_pkg_list = apt_load_jsonpickle_object(deb_pkg_filename)
+        for section in apt_packed_sections:
+            deb_pkg_list[section] = unpack_records(deb_pkg_list[section])
 
-        if deb_pkg_list['distro'].codename == distro.codename and deb_pkg_list['distro'].id == distro.id:
+        saved_distro = (deb_pkg_list['distro']['codename'], deb_pkg_list['distro']['id'])
+        host_distro = (distro_codename, distro_id)
 
-            print("The file contains information about {} manually installed packages to install.".format(deb_pkg_list['package_stats']['total']))
+        if saved_distro == host_distro:
+
+            # many packages share the same repository and key, keep only one copy of such strings
+            for tp in itertools.chain(deb_pkg_list['thirdparty_packages'], deb_pkg_list['launchpad_ppa_packages']):
+                tp['name'] = sys.intern(tp['name'])
+                if tp['repo']:
+                    tp['repo'] = sys.intern(tp['repo'])
+            for tpk in deb_pkg_list['thirdparty_keys']:
+                if tpk['key']:
+                    tpk['key']['key'] = sys.intern(tpk['key']['key'])
+
+            print(f"The file contains information about {deb_pkg_list['package_stats']['total']} manually installed packages to install.")
 
             if deb_pkg_list['package_stats']['total'] > 0:
-                append_command_to_script(apt_script_file, "#!/bin/bash")
-                append_command_to_script(apt_script_file, "lsb_release -cs | grep -q '" + distro.codename + "' || { echo 'Error: you are running different system version. Script will stop.'; exit; }")
+                script_lines.append("#!/bin/bash")
+                script_lines.append("set -e")
+                script_lines.append("lsb_release -cs | grep -q '" + distro_codename + "' || { echo 'Error: you are running different system version. Script will stop.'; exit 1; }")
 
                 if deb_pkg_list['package_stats']['official'] > 0:
-                    print("\n\nThe file contains list of the following {} official deb-packages:".format(deb_pkg_list['package_stats']['official']))
+                    print(f"\n\nThe file contains list of the following {deb_pkg_list['package_stats']['official']} official deb-packages:")
                     print(apt_show_package_names_dict(deb_pkg_list['official_packages']))
 
                     # adding commands to installation script for official packages
-                    append_command_to_script(apt_script_file, "dpkg --add-architecture i386")
+                    script_lines.append("dpkg --add-architecture i386")
 
                     for c in extract_unique_elements(deb_pkg_list['official_packages'], 'component'):
                         if c:
-                            append_command_to_script(apt_script_file, "add-apt-repository {}".format(c))
+                            script_lines.append(f"add-apt-repository {c}")
 
-                    append_command_to_script(apt_script_file, "apt-get update")
+                    script_lines.append("apt-get update")
 
-                    off_pkgs = ' '.join(extract_unique_elements(deb_pkg_list['official_packages'], 'name'))
-                    append_command_to_script(apt_script_file, "apt install {}".format(off_pkgs))
+                    off_pkgs = ' '.join(sorted({op['name'] for op in deb_pkg_list['official_packages']}))
+                    script_lines.append(f"apt install {off_pkgs}")
 
                 if deb_pkg_list['package_stats']['thirdparty'] > 0:
-                    print("\n\nThe file contains list of the following {} packages from third-party repositories:".format(deb_pkg_list['package_stats']['thirdparty']))
+                    print(f"\n\nThe file contains list of the following {deb_pkg_list['package_stats']['thirdparty']} packages from third-party repositories:")
                     print(apt_show_package_names_dict(deb_pkg_list['thirdparty_packages']))
 
-                    # adding command to installation script for third-party deb-repositories
-                    for tpk in extract_unique_elements(deb_pkg_list['thirdparty_keys'], 'key'):
-                        if tpk:
-                            append_command_to_script(apt_script_file, "apt-key adv --keyserver hkp://keyserver.ubuntu.com:80 --recv {}".format(tpk['key']))
+                    # collecting unique keys, repositories and package names in one pass,
+                    # dicts are used as ordered sets
+                    tp_keys = dict()
+                    for tpk in deb_pkg_list['thirdparty_keys']:
+                        if tpk['key']:
+                            tp_keys[tpk['key']['key']] = None
 
-                    for tpr in extract_unique_elements(deb_pkg_list['thirdparty_packages'], 'repo'):
-                        if tpr:
-                            append_command_to_script(apt_script_file, "add-apt-repository '{}'".format(tpr))
+                    tp_repos = dict()
+                    tp_names = dict()
+                    for tp in deb_pkg_list['thirdparty_packages']:
+                        if tp['repo']:
+                            tp_repos[tp['repo']] = None
+                        tp_names[tp['name']] = None
 
-                    append_command_to_script(apt_script_file, "apt-get update")
+                    # adding command to installation script for third-party deb-repositories
+                    if tp_keys:  # receive all keys by one call in background while repositories are added
+                        script_lines.append(f"apt-key adv --keyserver hkp://keyserver.ubuntu.com:80 --recv {' '.join(tp_keys)} &")
+                        script_lines.append("tp_keys_pid=$!")
+
+                    tp_repo_list = list(tp_repos)
+                    tp_update = None  # command for updating package lists after adding of repositories
+                    if tp_repo_list:
+                        if distro_name == 'Ubuntu':
+                            # add-apt-repository updates package lists by itself, do it only for the last repository
+                            for tpr in tp_repo_list[:-1]:
+                                script_lines.append(f"add-apt-repository -y -n '{tpr}'")
+                            tp_update = f"add-apt-repository -y '{tp_repo_list[-1]}'"
+                        else:
+                            for tpr in tp_repo_list:
+                                script_lines.append(f"add-apt-repository '{tpr}'")
+                            tp_update = "apt-get update"
 
-                    tpr_pkgs = ' '.join(extract_unique_elements(deb_pkg_list['thirdparty_packages'], 'name'))
-                    append_command_to_script(apt_script_file, "apt install {}".format(tpr_pkgs))
+                    if tp_keys:  # keys are needed for updating of package lists
+                        script_lines.append("wait $tp_keys_pid")
+                    if tp_update:
+                        script_lines.append(tp_update)
+
+                    tpr_pkgs = ' '.join(sorted(tp_names))
+                    script_lines.append(f"apt install {tpr_pkgs}")
 
                 if deb_pkg_list['package_stats']['ppas'] > 0:
-                    print("\n\nThe file contains list of the following {} packages from PPAs:".format(deb_pkg_list['package_stats']['ppas']))
+                    print(f"\n\nThe file contains list of the following {deb_pkg_list['package_stats']['ppas']} packages from PPAs:")
                     print(apt_show_package_names_dict(deb_pkg_list['launchpad_ppa_packages']))
 
                     # adding command to installation script for PPAs
                     for ppa in extract_unique_elements(deb_pkg_list['launchpad_ppa_packages'], 'repo'):
                         if ppa:
                             if distro_name == 'AstraLinux':
-                                append_command_to_script(apt_script_file, "add-apt-repository '{}/ubuntu {} main'".format(ppa.replace("ppa:", "deb http://ppa.launchpad.net/"), astra_nearest_ubuntu_version))
+                                script_lines.append(f"add-apt-repository '{ppa.replace('ppa:', 'deb http://ppa.launchpad.net/')}/ubuntu {astra_nearest_ubuntu_version} main'")
                             elif distro_name == 'Debian':
-                                append_command_to_script(apt_script_file, "add-apt-repository '{}/ubuntu {} main'".format(ppa.replace("ppa:", "deb http://ppa.launchpad.net/"), debian_nearest_ubuntu_version))
+                                script_lines.append(f"add-apt-repository '{ppa.replace('ppa:', 'deb http://ppa.launchpad.net/')}/ubuntu {debian_nearest_ubuntu_version} main'")
                             else:
-                                append_command_to_script(apt_script_file, "add-apt-repository {}".format(ppa))
+                                script_lines.append(f"add-apt-repository {ppa}")
 
-                    append_command_to_script(apt_script_file, "apt-get update")
+                    script_lines.append("apt-get update")
 
-                    ppa_pkgs = ' '.join(extract_unique_elements(deb_pkg_list['launchpad_ppa_packages'], 'name'))
-                    append_command_to_script(apt_script_file, "apt install {}".format(ppa_pkgs))
+                    ppa_pkgs = ' '.join(sorted({lpp['name'] for lpp in deb_pkg_list['launchpad_ppa_packages']}))
+                    script_lines.append(f"apt install {ppa_pkgs}")
 
                 if deb_pkg_list['package_stats']['local'] > 0:
-                    print("\n\nThe file contains list of the following {} locally installed packages:".format(deb_pkg_list['package_stats']['local']))
+                    print(f"\n\nThe file contains list of the following {deb_pkg_list['package_stats']['local']} locally installed packages:")
                     print(deb_pkg_list['local_packages'])
                     print("Note: this script can't really guess the origin of these packages, so you have to download them by yourself.")
 
-                print("\n\nAll installation commands were written into '{}' file.".format(apt_script_file))
-                print("You can review its contents and then interactively run it using 'sudo bash ./{}'.".format(apt_script_file))
+                print(f"\n\nAll installation commands were written into '{apt_script_file}' file.")
+                print(f"You can review its contents and then interactively run it using 'sudo bash ./{apt_script_file}'.")
 
         else:  # wrong distro and codename
-            print("Error: JSON file was created for {} {}, but you are now using {} {}. This is not supported. Script will stop.".format(deb_pkg_list['distro'].codename, deb_pkg_list['distro'].id, distro.codename, distro.id))
+            print(f"Error: JSON file was created for {saved_distro[0]} {saved_distro[1]}, but you are now using {host_distro[0]} {host_distro[1]}. This is not supported. Script will stop.")
+
+        # write to temporary file and rename it, so the script is never left partially written
+        apt_script_file_tmp = apt_script_file + ".tmp"
+        with open(apt_script_file_tmp, 'w') as fsh:
+            fsh.writelines(line + "\n" for line in script_lines)
+        os.replace(apt_script_file_tmp, apt_script_file)
 
     print("APT finished.")
 
 
+class ThreadOutput:
+    """
+    Replacement for sys.stdout which collects output of worker threads in separate buffers,
+    so outputs of operations running in parallel are not interleaved
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def start_buffer(self):
+        self.local.buffer = io.StringIO()
+
+    def flush_buffer(self):
+        text = self.local.buffer.getvalue()
+        del self.local.buffer
+        with self.lock:
+            self.stream.write(text)
+            self.stream.flush()
+
+    def write(self, s):
+        return getattr(self.local, 'buffer', self.stream).write(s)
+
+    def flush(self):
+        getattr(self.local, 'buffer', self.stream).flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def run_buffered(output, fn, mode, errors):
+    """
+    Auxilary function for running operation 'fn' in worker thread,
+    its output is collected by 'output' and printed at once when operation finishes.
+    Exceptions (including sys.exit() calls) are stored in 'errors' list.
+    """
+
+    output.start_buffer()
+    try:
+        fn(mode)
+    except BaseException as e:
+        errors.append(e)
+    finally:
+        output.flush_buffer()
+
+
+def run_parallel(fns, mode):
+    """
+    Function for running operations 'fns' in parallel with separately buffered outputs.
+    Daemon threads are used, so Ctrl+C stops the script without waiting for them.
+    """
+
+    output = ThreadOutput(sys.stdout)
+    errors = []
+    threads = [threading.Thread(target=run_buffered, args=(output, fn, mode, errors), daemon=True) for fn in fns]
+
+    sys.stdout = output
+    try:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        sys.stdout = output.stream
+
+    if errors:
+        raise errors[0]
+
+
 """
 /local functions end
 """
@@ -869,51 +1240,40 @@ if __name__ == "__main__":
     if len(sys.argv) >= 2:
         op = sys.argv[1]
 
-        if op == 'snap_save':
-            if snap_ok:
-                snap_operations('save')
-        elif op == 'snap_load':
-            if snap_ok:
-                snap_operations('load')
-        elif op == 'flatpak_save':
-            if flatpak_ok:
-                flatpak_operations('save')
-        elif op == 'flatpak_load':
-            if flatpak_ok:
-                flatpak_operations('load')
-        elif op == 'umake_save':
-            if umake_ok:
-                umake_operations('save')
-        elif op == 'umake_load':
-            if umake_ok:
-                umake_operations('load')
-        elif op == 'apt_save':
-            if apt_ok:
-                apt_operations('save')
-        elif op == 'apt_load':
-            if apt_ok:
-                apt_operations('load')
-        elif op == 'all_save':
-            if snap_ok:
-                snap_operations('save')
-            if flatpak_ok:
-                flatpak_operations('save')
-            if umake_ok:
-                umake_operations('save')
-            if apt_ok:
-                apt_operations('save')
-        elif op == 'all_load':
-            if snap_ok:
-                snap_operations('load')
-            if flatpak_ok:
-                flatpak_operations('load')
-            if umake_ok:
-                umake_operations('load')
-            if apt_ok:
-                apt_operations('load')
+        # operation name -> (supported?, function, mode)
+        operations = {
+            'snap_save': (snap_ok, snap_operations, 'save'),
+            'snap_load': (snap_ok, snap_operations, 'load'),
+            'flatpak_save': (flatpak_ok, flatpak_operations, 'save'),
+            'flatpak_load': (flatpak_ok, flatpak_operations, 'load'),
+            'umake_save': (umake_ok, umake_operations, 'save'),
+            'umake_load': (umake_ok, umake_operations, 'load'),
+            'apt_save': (apt_ok, apt_operations, 'save'),
+            'apt_load': (apt_ok, apt_operations, 'load'),
+        }
+
+        if op in operations:
+            ok, fn, mode = operations[op]
+            if ok:
+                fn(mode)
+        elif op in ('all_save', 'all_load'):
+            mode = op.split('_')[1]
+            fns = []
+            for name in ('snap', 'flatpak', 'umake', 'apt'):
+                ok, fn, __ = operations[name + '_' + mode]
+                if ok:
+                    fns.append(fn)
+
+            if mode == 'save':
+                # save operations mostly wait for subprocesses and daemons, so run them at once
+                run_parallel(fns, mode)
+            else:
+                # load operations may ask questions and passwords, so run them one by one in foreground
+                for fn in fns:
+                    fn(mode)
         else:
-            print("Error: option '{}' is not supported.".format(op))
+            print(f"Error: option '{op}' is not supported.")
 
     else:
-        print("\nUsage {} with one argument:\n - 'snap_save'/'snap_load' (for Snap),\n - 'flatpak_save'/'flatpak_load' (for FlatPak),\n - 'umake_save'/'umake_load' (for Ubuntu Make),\n - 'apt_save'/'apt_load' (for APT),".format(sys.argv[0]))
+        print(f"\nUsage {sys.argv[0]} with one argument:\n - 'snap_save'/'snap_load' (for Snap),\n - 'flatpak_save'/'flatpak_load' (for FlatPak),\n - 'umake_save'/'umake_load' (for Ubuntu Make),\n - 'apt_save'/'apt_load' (for APT),")
         print(" - 'all_save'/'all_load' (for Snap, Flatpak, Ubuntu Make and APT in one shot).")